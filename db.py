@@ -0,0 +1,41 @@
+import sqlite3
+
+DB_PATH = "artists.db"
+
+# ─────────────────────────────────────────────
+# CONNECTION SETUP
+# ─────────────────────────────────────────────
+PRAGMAS = """
+    PRAGMA journal_mode = WAL;
+    PRAGMA synchronous = NORMAL;
+    PRAGMA busy_timeout = 5000;
+    PRAGMA temp_store = MEMORY;
+    PRAGMA cache_size = -20000;
+"""
+
+def connect_db(check_same_thread: bool = True):
+    """Open an autocommit connection to the artists DB with WAL + tuned PRAGMAs."""
+    conn = sqlite3.connect(DB_PATH, isolation_level=None, timeout=5,
+                           check_same_thread=check_same_thread)
+    conn.executescript(PRAGMAS)
+    return conn
+
+# ─────────────────────────────────────────────
+# INDEXES
+# ─────────────────────────────────────────────
+def ensure_indexes(conn):
+    """
+    Create lookup indexes on artists once the youtube_channel column exists.
+    name is already UNIQUE (so it has its own index); idx_artists_name_channel
+    additionally covers the channel lookup so it never touches the table row.
+    """
+    cols = [c[1] for c in conn.execute("PRAGMA table_info(artists)")]
+    if "youtube_channel" not in cols:
+        return
+    conn.executescript("""
+        CREATE INDEX IF NOT EXISTS idx_artists_name_channel
+            ON artists(name, youtube_channel);
+        CREATE INDEX IF NOT EXISTS idx_artists_pending
+            ON artists(youtube_channel)
+            WHERE youtube_channel IS NULL OR youtube_channel = '';
+    """)
@@ -1,9 +1,12 @@
-import sqlite3
 import spotipy
+from spotipy.exceptions import SpotifyException
 from spotipy.oauth2 import SpotifyClientCredentials
 import sys
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from db import connect_db, ensure_indexes
 
 # ─────────────────────────────────────────────
 # CONFIGURATION
@@ -12,13 +15,15 @@ load_dotenv()
 
 SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
-DB_PATH = "artists.db"
+PLAYLIST_WORKERS = 4  # playlists fetched concurrently
+PAGE_FETCH_WORKERS = 4  # background threads prefetching the next page of tracks
+MAX_RATE_LIMIT_RETRIES = 5
 
 # ─────────────────────────────────────────────
 # DATABASE SETUP
 # ─────────────────────────────────────────────
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_db()
     cur = conn.cursor()
 
     # Ensure base table exists
@@ -43,6 +48,8 @@ def init_db():
         cur.execute("ALTER TABLE artists ADD COLUMN channel_url TEXT;")
         conn.commit()
 
+    ensure_indexes(conn)
+
     return conn, cur
 
 # ─────────────────────────────────────────────
@@ -55,6 +62,56 @@ def get_spotify_client():
     )
     return spotipy.Spotify(auth_manager=auth_manager)
 
+def spotify_call(fn, *args, **kwargs):
+    """Call a spotipy method, backing off on 429 responses using Retry-After."""
+    for attempt in range(MAX_RATE_LIMIT_RETRIES):
+        try:
+            return fn(*args, **kwargs)
+        except SpotifyException as e:
+            if e.http_status != 429 or attempt == MAX_RATE_LIMIT_RETRIES - 1:
+                raise
+            headers = getattr(e, "headers", None) or {}
+            retry_after = int(headers.get("Retry-After", 1))
+            print(f"⏳ Rate limited by Spotify, retrying in {retry_after}s ...")
+            time.sleep(retry_after)
+
+# ─────────────────────────────────────────────
+# FETCH A SINGLE PLAYLIST
+# ─────────────────────────────────────────────
+def fetch_playlist(sp, playlist_url, page_executor) -> dict[str, str]:
+    """Return {artist: first song name} for every track in one playlist."""
+    playlist_id = playlist_url.split("/")[-1].split("?")[0]
+    print(f"🎧 Fetching playlist: {playlist_id} ...")
+
+    artists = {}
+
+    try:
+        results = spotify_call(sp.playlist_tracks, playlist_id, fields="items.track.artists,items.track.name,next,total")
+    except Exception as e:
+        print(f"⚠️  Failed to fetch playlist {playlist_url}: {e}")
+        return artists
+
+    # Paginate through tracks, fetching the next page while this one is parsed
+    while results:
+        next_page = page_executor.submit(spotify_call, sp.next, results) if results.get("next") else None
+
+        for item in results.get("items", []):
+            track = item.get("track")
+            if not track:
+                continue
+            track_name = track.get("name", "").strip()
+            for artist in track.get("artists", []):
+                artist_name = artist.get("name", "").strip()
+                # Keep first song we encounter for each unique artist
+                if artist_name and artist_name not in artists:
+                    artists[artist_name] = track_name
+
+        if next_page is None:
+            break
+        results = next_page.result()
+
+    return artists
+
 # ─────────────────────────────────────────────
 # EXPORT ARTISTS FROM PLAYLISTS
 # ─────────────────────────────────────────────
@@ -64,56 +121,44 @@ def export_artists_from_playlists(playlist_urls):
 
     all_artists = {}
 
-    for playlist_url in playlist_urls:
-        playlist_id = playlist_url.split("/")[-1].split("?")[0]
-        print(f"🎧 Fetching playlist: {playlist_id} ...")
+    with ThreadPoolExecutor(max_workers=PLAYLIST_WORKERS) as playlist_executor, \
+         ThreadPoolExecutor(max_workers=PAGE_FETCH_WORKERS) as page_executor:
+        futures = [playlist_executor.submit(fetch_playlist, sp, url, page_executor) for url in playlist_urls]
 
-        try:
-            results = sp.playlist_tracks(playlist_id, fields="items.track.artists,items.track.name,next,total")
-        except Exception as e:
-            print(f"⚠️  Failed to fetch playlist {playlist_url}: {e}")
-            continue
-
-        # Paginate through tracks
-        while results:
-            for item in results.get("items", []):
-                track = item.get("track")
-                if not track:
-                    continue
-                track_name = track.get("name", "").strip()
-                for artist in track.get("artists", []):
-                    artist_name = artist.get("name", "").strip()
-                    # Keep first song we encounter for each unique artist
-                    if artist_name and artist_name not in all_artists:
-                        all_artists[artist_name] = track_name
-            if results.get("next"):
-                results = sp.next(results)
-            else:
-                break
+        # Merge in playlist order so the first playlist's song still wins
+        for future in futures:
+            for artist, song_name in future.result().items():
+                all_artists.setdefault(artist, song_name)
 
     print(f"\n🎵 Found {len(all_artists)} unique artists across all playlists.\n")
 
+    artist_rows = [(artist,) for artist in sorted(all_artists)]
+    song_rows = [(song_name, artist) for artist, song_name in sorted(all_artists.items())]
+
     added_artists = 0
     added_song_names = 0
 
-    for artist, song_name in sorted(all_artists.items()):
-        try:
-            cur.execute("INSERT OR IGNORE INTO artists (name) VALUES (?)", (artist,))
-            if cur.rowcount:
-                added_artists += 1
+    try:
+        cur.execute("BEGIN")
 
-            cur.execute("""
-                UPDATE artists
-                SET song_name = ?
-                WHERE name = ? AND (song_name IS NULL OR song_name = '')
-            """, (song_name, artist))
-            if cur.rowcount:
-                added_song_names += 1
+        changes_before = conn.total_changes
+        cur.executemany("INSERT OR IGNORE INTO artists (name) VALUES (?)", artist_rows)
+        added_artists = conn.total_changes - changes_before
 
-        except Exception as e:
-            print(f"⚠️  Failed to insert/update {artist}: {e}")
+        changes_before = conn.total_changes
+        cur.executemany("""
+            UPDATE artists
+            SET song_name = ?
+            WHERE name = ? AND (song_name IS NULL OR song_name = '')
+        """, song_rows)
+        added_song_names = conn.total_changes - changes_before
+
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        added_artists = added_song_names = 0
+        print(f"⚠️  Failed to insert/update artists: {e}")
 
-    conn.commit()
     conn.close()
 
     total_updates = added_artists + added_song_names
@@ -1,81 +1,137 @@
-import sqlite3
+import asyncio
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from youtube_searcher import find_or_cache_artist_channel
+from concurrent.futures import ThreadPoolExecutor
+from db import connect_db, ensure_indexes
+from youtube_searcher import find_or_cache_artist_channel, set_artist_channels
 
-DB_PATH = "artists.db"
-MAX_WORKERS = 8  # safe upper limit (try 6–10 depending on CPU and connection)
+MAX_CONCURRENCY = 50  # artists searched at once (lower if YouTube starts throttling)
+FLUSH_EVERY = 50  # buffered search results per DB commit
+RETRY_AFTER = 24 * 60 * 60  # seconds before an unsuccessful artist is searched again
+
+def ensure_search_attempts_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS channel_search_attempts (
+            name TEXT PRIMARY KEY,
+            last_try INTEGER
+        )
+    """)
 
 def get_pending_artists():
-    """Return a list of artists without channel links."""
-    conn = sqlite3.connect(DB_PATH)
+    """Return artists without channel links that weren't searched in the last RETRY_AFTER seconds."""
+    conn = connect_db()
+    ensure_indexes(conn)
+    ensure_search_attempts_table(conn)
     cur = conn.cursor()
     cur.execute("""
         SELECT name FROM artists
-        WHERE youtube_channel IS NULL OR youtube_channel = ''
-    """)
+        WHERE (youtube_channel IS NULL OR youtube_channel = '')
+          AND NOT EXISTS (
+              SELECT 1 FROM channel_search_attempts a
+              WHERE a.name = artists.name
+                AND a.last_try > CAST(strftime('%s', 'now') AS INTEGER) - ?
+          )
+    """, (RETRY_AFTER,))
     artists = [row[0] for row in cur.fetchall()]
     conn.close()
     return artists
 
-def update_channel_in_db(artist: str, url: str):
-    """Thread-safe DB update."""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("UPDATE artists SET youtube_channel = ? WHERE name = ?", (url, artist))
-    conn.commit()
-    conn.close()
+def flush_search_results(conn, pending: list[tuple[str, str, int]]):
+    """Write buffered (artist, url, tried_at) results: found channels, then all attempts."""
+    if not pending:
+        return
+    set_artist_channels(((artist, url) for artist, url, _ in pending if url), conn)
+    conn.execute("BEGIN")
+    try:
+        conn.executemany(
+            "INSERT OR REPLACE INTO channel_search_attempts (name, last_try) VALUES (?, ?)",
+            [(artist, tried_at) for artist, _, tried_at in pending],
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    pending.clear()
 
-def process_artist(artist: str):
-    """Thread worker: find a YouTube channel for the artist."""
-    url = find_or_cache_artist_channel(artist)
-    return artist, url
+async def process_artist(artist: str, semaphore: asyncio.Semaphore):
+    """Find a YouTube channel for the artist without blocking the event loop."""
+    async with semaphore:
+        try:
+            # db_writer batches the channel write, so skip the per-artist commit here
+            url = await asyncio.to_thread(find_or_cache_artist_channel, artist, save=False)
+        except Exception as e:
+            return artist, None, e
+    if url is None:
+        # The search itself failed (not "no match"), so don't count it as an attempt
+        return artist, None, "YouTube search failed"
+    return artist, url, None
 
-def main():
+async def db_writer(queue: asyncio.Queue):
+    """Single writer: drain (artist, url, tried_at) results from the queue into the DB."""
+    conn = connect_db()
+    pending = []
     try:
-        pending_artists = get_pending_artists()
-        total_pending = len(pending_artists)
-        if total_pending == 0:
-            print("✅ All artists already have channel links!")
-            return
+        while (item := await queue.get()) is not None:
+            pending.append(item)
+            if len(pending) >= FLUSH_EVERY:
+                flush_search_results(conn, pending)
+        flush_search_results(conn, pending)
+    finally:
+        conn.close()
+
+async def run():
+    pending_artists = get_pending_artists()
+    total_pending = len(pending_artists)
+    if total_pending == 0:
+        print("✅ All artists already have channel links!")
+        return
 
-        print(f"🔍 Found {total_pending} artists missing channels.")
-        print(f"⚙️ Running with {MAX_WORKERS} threads.\n")
+    print(f"🔍 Found {total_pending} artists missing channels.")
+    print(f"⚙️ Running with up to {MAX_CONCURRENCY} concurrent searches.\n")
 
-        start_time = time.time()
-        found = 0
+    # yt-dlp is synchronous, so size the to_thread pool to match the semaphore
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=MAX_CONCURRENCY))
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    queue = asyncio.Queue()
+    writer_task = asyncio.create_task(db_writer(queue))
 
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            futures = {executor.submit(process_artist, artist): artist for artist in pending_artists}
+    start_time = time.time()
+    found = 0
 
-            for i, future in enumerate(as_completed(futures), start=1):
-                artist = futures[future]
-                try:
-                    artist, url = future.result()
-                    if url:
-                        update_channel_in_db(artist, url)
-                        found += 1
-                        print(f"[{i}/{total_pending}] ✅ {artist} → {url}")
-                    else:
-                        print(f"[{i}/{total_pending}] ❌ {artist}")
-                except Exception as e:
-                    print(f"[{i}/{total_pending}] ⚠️ {artist} failed: {e}")
+    tasks = [asyncio.create_task(process_artist(artist, semaphore)) for artist in pending_artists]
+    try:
+        for i, next_done in enumerate(asyncio.as_completed(tasks), start=1):
+            artist, url, error = await next_done
+            if error:
+                # Not recorded as an attempt, so transient errors are retried next run
+                print(f"[{i}/{total_pending}] ⚠️ {artist} failed: {error}")
+            else:
+                await queue.put((artist, url, int(time.time())))
+                if url:
+                    found += 1
+                    print(f"[{i}/{total_pending}] ✅ {artist} → {url}")
+                else:
+                    print(f"[{i}/{total_pending}] ❌ {artist}")
 
-                # ETA display
-                elapsed = time.time() - start_time
-                avg_time = elapsed / i
-                remaining = total_pending - i
-                eta = remaining * avg_time / 60
-                print(f"    ⏱️ ETA: {eta:.1f} min remaining")
+            # ETA display
+            elapsed = time.time() - start_time
+            avg_time = elapsed / i
+            remaining = total_pending - i
+            eta = remaining * avg_time / 60
+            print(f"    ⏱️ ETA: {eta:.1f} min remaining")
+    finally:
+        # Flush whatever was found, even when interrupted
+        await queue.put(None)
+        await writer_task
 
-        elapsed_total = (time.time() - start_time) / 60
-        print(f"\n✅ Completed: {found}/{total_pending} channels found ({found/total_pending*100:.1f}%)")
-        print(f"⏳ Total time: {elapsed_total:.1f} minutes")
+    elapsed_total = (time.time() - start_time) / 60
+    print(f"\n✅ Completed: {found}/{total_pending} channels found ({found/total_pending*100:.1f}%)")
+    print(f"⏳ Total time: {elapsed_total:.1f} minutes")
 
+def main():
+    try:
+        asyncio.run(run())
     except KeyboardInterrupt:
-        print("\n🛑 Interrupted by user — stopping threads and closing cleanly.")
-        # ThreadPoolExecutor automatically joins threads here
-        return
+        print("\n🛑 Interrupted by user — stopping searches and closing cleanly.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,111 @@
+from difflib import SequenceMatcher
+
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:  # fall back to difflib
+    fuzz = process = None
+
+try:
+    import numpy as np
+except ImportError:  # best_match scores in pure Python instead
+    np = None
+
+# ─────────────────────────────────────────────
+# NUMBA FALLBACK KERNELS
+# ─────────────────────────────────────────────
+# Only imported/compiled when rapidfuzz is missing. They compute the same
+# Indel-based score as fuzz.ratio, 2·LCS / (len(a) + len(b)), over code points.
+njit = prange = None
+if fuzz is None:
+    try:
+        from numba import njit, prange
+    except ImportError:  # without rapidfuzz, use difflib
+        pass
+
+if njit is not None:
+    @njit(cache=True)
+    def _lcs_len(a, b):
+        prev = np.zeros(len(b) + 1, np.int32)
+        cur = np.zeros(len(b) + 1, np.int32)
+        for i in range(len(a)):
+            for j in range(len(b)):
+                if a[i] == b[j]:
+                    cur[j + 1] = prev[j] + 1
+                else:
+                    cur[j + 1] = max(prev[j + 1], cur[j])
+            prev, cur = cur, prev
+        return prev[len(b)]
+
+    @njit(cache=True)
+    def _pair_ratio(a, b):
+        total = len(a) + len(b)
+        return 1.0 if total == 0 else 2.0 * _lcs_len(a, b) / total
+
+    @njit(parallel=True, cache=True)
+    def _batch_ratio(query, flat, offsets):
+        out = np.empty(len(offsets) - 1)
+        for k in prange(len(offsets) - 1):
+            out[k] = _pair_ratio(query, flat[offsets[k]:offsets[k + 1]])
+        return out
+
+def _codepoints(s: str):
+    return np.frombuffer(s.encode("utf-32-le"), dtype=np.uint32)
+
+def _numba_scores(query: str, choices: list[str]) -> list[float]:
+    offsets = np.zeros(len(choices) + 1, np.int64)
+    offsets[1:] = np.cumsum([len(c) for c in choices])
+    flat = _codepoints("".join(choices))
+    return _batch_ratio(_codepoints(query), flat, offsets).tolist()
+
+# ─────────────────────────────────────────────
+# STRING SIMILARITY
+# ─────────────────────────────────────────────
+def ratio(a: str, b: str, score_cutoff: float = 0.0) -> float:
+    """
+    Similarity of two strings (0–1), via rapidfuzz's C++ ratio when available,
+    else the numba kernel, else difflib. Scores below score_cutoff come back as
+    0.0, which lets rapidfuzz and difflib bail early (difflib checks its cheap
+    upper bounds before the full ratio).
+    """
+    if fuzz is None and njit is not None:
+        score = _pair_ratio(_codepoints(a), _codepoints(b))
+        return score if score >= score_cutoff else 0.0
+    if fuzz is None:
+        sm = SequenceMatcher(None, a, b)
+        if score_cutoff > 0 and (sm.real_quick_ratio() < score_cutoff
+                                 or sm.quick_ratio() < score_cutoff):
+            return 0.0
+        score = sm.ratio()
+        return score if score >= score_cutoff else 0.0
+    return fuzz.ratio(a, b, score_cutoff=score_cutoff * 100) / 100.0
+
+def similarity_scores(query: str, choices: list[str]) -> list[float]:
+    """Similarity (0–1) of query against each choice, batched through rapidfuzz (or numba) when available."""
+    if process is None and njit is not None and choices:
+        return _numba_scores(query, choices)
+    if process is None:
+        return [SequenceMatcher(None, query, c).ratio() for c in choices]
+    scores = [0.0] * len(choices)
+    for _, score, i in process.extract(query, choices, scorer=fuzz.ratio, limit=None):
+        scores[i] = score / 100.0
+    return scores
+
+def best_match(query: str, choices: list[str], bonuses: list[float]) -> tuple[int, float]:
+    """
+    Index and score of the best choice, where each choice scores its similarity
+    plus its bonus. Ties go to the earliest choice; (-1, -1.0) if there are none.
+    With rapidfuzz + numpy this is one cdist call and an argmax.
+    """
+    if not choices:
+        return -1, -1.0
+    if process is not None and np is not None:
+        scores = process.cdist([query], choices, scorer=fuzz.ratio, dtype=np.float64)[0] / 100.0
+        scores += np.asarray(bonuses, dtype=np.float64)
+        best = int(scores.argmax())
+        return best, float(scores[best])
+    best, best_score = -1, float("-inf")
+    for i, score in enumerate(similarity_scores(query, choices)):
+        score += bonuses[i]
+        if score > best_score:
+            best, best_score = i, score
+    return best, best_score
@@ -1,34 +1,40 @@
+import asyncio
 import csv
-import sqlite3
-import subprocess
 import re
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Lock
-from difflib import SequenceMatcher
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from urllib.parse import quote_plus
+from db import connect_db, ensure_indexes
+from fuzzy import similarity_scores
+from ytdl import SEARCH_LIMIT, DownloadError, entry_url, extract_entries
 
-DB_PATH = "artists.db"
 OUTPUT_FILE = Path("missing_channel_matches_v2.csv")
-MAX_WORKERS = 8
+MAX_CONCURRENCY = 50  # channel searches at once (lower if YouTube starts throttling)
+FLUSH_EVERY = 100  # buffered results per DB commit / CSV flush
 
 # ─────────────────────────────────────────────
 # UTILITIES
 # ─────────────────────────────────────────────
+# Byte table mapping everything except [a-z0-9] to a space (non-ASCII is pre-replaced with "?")
+_ALNUM_TABLE = bytes(c if chr(c) in "abcdefghijklmnopqrstuvwxyz0123456789" else ord(" ") for c in range(256))
+_RE_STOPWORDS = re.compile(r"\b(official|video|audio|lyric|lyrics|music|visualizer|mv)\b")
+
+@lru_cache(maxsize=8192)
 def normalize(s: str) -> str:
-    """Normalize titles for loose comparison."""
+    """Normalize titles for loose comparison (runs of whitespace collapse to one space)."""
     if not s:
         return ""
-    s = s.lower()
-    s = re.sub(r"[^a-z0-9]+", " ", s)
-    s = re.sub(r"\b(official|video|audio|lyric|lyrics|music|visualizer|mv)\b", "", s)
-    return s.strip()
+    s = s.lower().encode("ascii", "replace").translate(_ALNUM_TABLE).decode("ascii")
+    s = _RE_STOPWORDS.sub("", s)
+    return " ".join(s.split())
 
 # ─────────────────────────────────────────────
 # DATABASE
 # ─────────────────────────────────────────────
 def ensure_auto_verified_column():
     """Add auto_verified column if it doesn't exist."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_db()
     cur = conn.cursor()
     cur.execute("PRAGMA table_info(artists)")
     cols = [c[1] for c in cur.fetchall()]
@@ -36,10 +42,11 @@ def ensure_auto_verified_column():
         cur.execute("ALTER TABLE artists ADD COLUMN auto_verified INTEGER DEFAULT 0")
         print("🆕 Added 'auto_verified' column to artists table.")
         conn.commit()
+    ensure_indexes(conn)
     conn.close()
 
 def get_artists_with_channels():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_db()
     cur = conn.cursor()
     cur.execute("""
         SELECT id, name, song_name, youtube_channel
@@ -53,39 +60,33 @@ def get_artists_with_channels():
     conn.close()
     return rows
 
-def update_auto_verified(artist_name: str, channel_url: str, status: int):
-    """Set auto_verified flag in the DB for a specific artist and channel."""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("""
-        UPDATE artists
-        SET auto_verified = ?
-        WHERE name = ? AND youtube_channel = ?
-    """, (status, artist_name, channel_url))
-    conn.commit()
-    conn.close()
+def flush_auto_verified(conn, pending: list[tuple[int, str, str]]):
+    """Write buffered (status, artist, channel) auto_verified flags in a single transaction."""
+    if not pending:
+        return
+    conn.execute("BEGIN")
+    try:
+        conn.executemany("""
+            UPDATE artists
+            SET auto_verified = ?
+            WHERE name = ? AND youtube_channel = ?
+        """, pending)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    pending.clear()
 
 # ─────────────────────────────────────────────
 # YOUTUBE SEARCH
 # ─────────────────────────────────────────────
 def search_channel_for_song(youtube_channel: str, song_name: str) -> str | None:
     """Search the artist's YouTube channel using yt-dlp."""
-    query_url = f"{youtube_channel}/search?query={song_name.replace(' ', '+')}"
-    cmd = [
-        "yt-dlp",
-        "--flat-playlist",
-        "--quiet",
-        "--no-warnings",
-        "--print", "%(title)s | %(uploader)s | %(webpage_url)s",
-        query_url,
-    ]
+    query_url = f"{youtube_channel}/search?query={quote_plus(song_name)}"
 
     try:
-        output = subprocess.check_output(cmd, text=True, errors="ignore", timeout=12)
-    except subprocess.TimeoutExpired:
-        print(f"⏰ Timeout searching {youtube_channel}")
-        return None
-    except subprocess.CalledProcessError:
+        entries = extract_entries(query_url, playlistend=SEARCH_LIMIT)
+    except DownloadError:
         print(f"⚠️ yt-dlp failed for {youtube_channel}")
         return None
 
@@ -93,17 +94,19 @@ def search_channel_for_song(youtube_channel: str, song_name: str) -> str | None:
     best_score = 0.0
     song_norm = normalize(song_name)
 
-    for line in output.splitlines():
-        parts = [p.strip() for p in line.split("|")]
-        if len(parts) < 3:
+    candidates = []
+    for entry in entries:
+        title = (entry.get("title") or "").strip()
+        url = entry_url(entry)
+        if not title or not url:
             continue
-        title, uploader, url = parts[:3]
 
         title_norm = normalize(title)
-        if not title_norm:
-            continue
+        if title_norm:
+            candidates.append((title_norm, url))
 
-        score = SequenceMatcher(None, song_norm, title_norm).ratio()
+    titles = [title_norm for title_norm, _ in candidates]
+    for (title_norm, url), score in zip(candidates, similarity_scores(song_norm, titles)):
         if any(k in title_norm for k in ["lyric", "audio"]):
             score += 0.1
         if any(k in title_norm for k in ["live", "remix", "cover", "performance"]):
@@ -118,49 +121,78 @@ def search_channel_for_song(youtube_channel: str, song_name: str) -> str | None:
 # ─────────────────────────────────────────────
 # WORKER
 # ─────────────────────────────────────────────
-def verify_artist(row):
+async def verify_artist(row, semaphore: asyncio.Semaphore):
     _, artist, song, channel = row
-    url = search_channel_for_song(channel, song)
+    async with semaphore:
+        url = await asyncio.to_thread(search_channel_for_song, channel, song)
     return (artist, song, channel, bool(url))
 
+async def result_writer(queue: asyncio.Queue, csvfile):
+    """Single writer: batch auto_verified flags into the DB and misses into the CSV."""
+    writer = csv.writer(csvfile)
+    writer.writerow(["artist_name", "song_name", "youtube_channel"])
+
+    conn = connect_db()
+    pending_updates = []  # (status, artist, channel)
+    pending_csv = []
+    try:
+        while (item := await queue.get()) is not None:
+            artist, song, channel, found = item
+            pending_updates.append((int(found), artist, channel))
+            if not found:
+                pending_csv.append([artist, song, channel])
+
+            if len(pending_updates) >= FLUSH_EVERY:
+                flush_auto_verified(conn, pending_updates)
+                writer.writerows(pending_csv)
+                csvfile.flush()
+                pending_csv.clear()
+    finally:
+        flush_auto_verified(conn, pending_updates)
+        writer.writerows(pending_csv)
+        conn.close()
+
 # ─────────────────────────────────────────────
 # MAIN
 # ─────────────────────────────────────────────
-def verify_all_channels():
+async def run_verification():
     ensure_auto_verified_column()
     artists = get_artists_with_channels()
     total = len(artists)
     print(f"🔍 Verifying {total} artist channels using yt-dlp search queries...\n")
 
+    # yt-dlp is synchronous, so size the to_thread pool to match the semaphore
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=MAX_CONCURRENCY))
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    queue = asyncio.Queue()
     missing = []
-    lock = Lock()
 
     with open(OUTPUT_FILE, "w", encoding="utf-8", newline="") as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(["artist_name", "song_name", "youtube_channel"])
-
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            futures = {executor.submit(verify_artist, a): a for a in artists}
-
-            for i, f in enumerate(as_completed(futures), start=1):
-                artist, song, channel, found = f.result()
+        writer_task = asyncio.create_task(result_writer(queue, csvfile))
+        tasks = [asyncio.create_task(verify_artist(a, semaphore)) for a in artists]
+        try:
+            for i, next_done in enumerate(asyncio.as_completed(tasks), start=1):
+                artist, song, channel, found = await next_done
                 progress = f"[{i}/{total}] {artist} – {song}"
 
                 if found:
                     print(f"{progress} ✅")
-                    update_auto_verified(artist, channel, 1)
                 else:
                     print(f"{progress} ❌")
-                    update_auto_verified(artist, channel, 0)
-                    with lock:
-                        writer.writerow([artist, song, channel])
-                        missing.append((artist, song, channel))
+                    missing.append((artist, song, channel))
+                await queue.put((artist, song, channel, found))
+        finally:
+            await queue.put(None)
+            await writer_task
 
     print("\n─────────────────────────────")
     print(f"✅ Verified {total - len(missing)} channels")
     print(f"❌ {len(missing)} missing matches")
     print(f"📁 Saved results to: {OUTPUT_FILE.resolve()}\n")
 
+def verify_all_channels():
+    asyncio.run(run_verification())
+
 # ─────────────────────────────────────────────
 if __name__ == "__main__":
     verify_all_channels()
@@ -1,21 +1,34 @@
 from flask import Flask, render_template_string, request, jsonify
-import sqlite3
 from pathlib import Path
 import csv
+import json
 import re
+import time
 import requests
-import subprocess
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from db import connect_db, ensure_indexes
+from ytdl import DownloadError, entry_url, extract_entries
 
-DB_PATH = Path("artists.db")
 CSV_PATH = Path("missing_channel_matches.csv")
 
 app = Flask(__name__)
 
+# Shared writer for /verify — the dev server may handle requests on several threads
+WRITER = connect_db(check_same_thread=False)
+WRITER_LOCK = Lock()
+
+# Keep-alive session for channel page scrapes (reuses TCP/TLS connections to youtube.com)
+SESSION = requests.Session()
+SESSION.headers.update({"Accept-Encoding": "gzip, deflate", "User-Agent": "Mozilla/5.0"})
+SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+
 # ─────────────────────────────────────────────
 # Ensure verified + auto_verified columns exist
 # ─────────────────────────────────────────────
 def ensure_verified_columns():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_db()
     cur = conn.cursor()
     cur.execute("PRAGMA table_info(artists)")
     cols = [c[1] for c in cur.fetchall()]
@@ -26,125 +39,242 @@ def ensure_verified_columns():
         cur.execute("ALTER TABLE artists ADD COLUMN auto_verified INTEGER DEFAULT 0")
         print("🆕 Added 'auto_verified' column.")
     conn.commit()
+    ensure_indexes(conn)
     conn.close()
 
+ensure_verified_columns()
+
+# ─────────────────────────────────────────────
+# CSV ordering table
+# ─────────────────────────────────────────────
+def load_csv_order():
+    """Load the CSV row order into csv_order so SQL can sort by it."""
+    rows = []
+    if CSV_PATH.exists():
+        with open(CSV_PATH, encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            for i, row in enumerate(reader, start=1):
+                url = row.get("youtube_channel", "").strip()
+                if url:
+                    rows.append((url, i))
+
+    conn = connect_db()
+    conn.execute("CREATE TABLE IF NOT EXISTS csv_order (url TEXT PRIMARY KEY, idx INTEGER)")
+    conn.execute("BEGIN")
+    conn.execute("DELETE FROM csv_order")
+    conn.executemany("INSERT OR REPLACE INTO csv_order (url, idx) VALUES (?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+_csv_mtime = None
+
+def refresh_csv_order():
+    """Reload csv_order only when the CSV file has changed on disk."""
+    global _csv_mtime
+    mtime = CSV_PATH.stat().st_mtime if CSV_PATH.exists() else None
+    if mtime != _csv_mtime:
+        load_csv_order()
+        _csv_mtime = mtime
+
+refresh_csv_order()
+
 # ─────────────────────────────────────────────
-# CSV ordering map
+# Channel metadata cache (persists across restarts)
 # ─────────────────────────────────────────────
-def get_csv_index_map():
-    index_map = {}
-    if not CSV_PATH.exists():
-        return index_map
-    with open(CSV_PATH, encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for i, row in enumerate(reader, start=1):
-            url = row.get("youtube_channel", "").strip()
-            if url:
-                index_map[url] = i
-    return index_map
+META_FIELDS = ("banner", "avatar", "display_name", "handle", "subs")
+META_TTL = 7 * 86400  # seconds before a stored channel scrape is refreshed
+
+def ensure_channel_meta_table():
+    conn = connect_db()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS channel_meta (
+            url TEXT PRIMARY KEY,
+            banner TEXT,
+            avatar TEXT,
+            display_name TEXT,
+            handle TEXT,
+            subs TEXT,
+            videos_json TEXT,
+            fetched_at INTEGER
+        )
+    """)
+    conn.close()
+
+ensure_channel_meta_table()
+
+def get_cached_channel_metadata(url: str):
+    """Return stored metadata for a channel URL, or None if never fetched or expired."""
+    with WRITER_LOCK:
+        row = WRITER.execute("""
+            SELECT banner, avatar, display_name, handle, subs, videos_json
+            FROM channel_meta WHERE url = ? AND fetched_at > ?
+        """, (url, int(time.time()) - META_TTL)).fetchone()
+    if not row:
+        return None
+    *fields, videos_json = row
+    return {**dict(zip(META_FIELDS, fields)), "videos": json.loads(videos_json or "[]")}
+
+def save_channel_metadata(url: str, meta: dict):
+    with WRITER_LOCK:
+        WRITER.execute("""
+            INSERT OR REPLACE INTO channel_meta
+                (url, banner, avatar, display_name, handle, subs, videos_json, fetched_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (url, *(meta[k] for k in META_FIELDS), json.dumps(meta["videos"]), int(time.time())))
 
 # ─────────────────────────────────────────────
 # Channel metadata + video fetching
 # ─────────────────────────────────────────────
-_channel_cache = {}
+
+_INITIAL_DATA_RE = re.compile(r'ytInitialData"?\]?\s*=\s*({.+?});\s*</script>', re.S)
+
+def _thumb_url(node):
+    """Largest thumbnail URL from a {"thumbnails": [...]} node."""
+    thumbs = (node or {}).get("thumbnails") or []
+    return thumbs[-1].get("url") if thumbs else None
+
+def parse_initial_data(html: str) -> dict:
+    """Pull channel header fields out of the page's ytInitialData JSON blob."""
+    m = _INITIAL_DATA_RE.search(html)
+    if not m:
+        return {}
+    try:
+        data = json.loads(m.group(1))
+    except json.JSONDecodeError:
+        return {}
+
+    header = data.get("header", {}).get("c4TabbedHeaderRenderer", {})
+    channel_meta = data.get("metadata", {}).get("channelMetadataRenderer", {})
+    handle_runs = header.get("channelHandleText", {}).get("runs") or [{}]
+
+    parsed = {
+        "banner": _thumb_url(header.get("banner")),
+        "avatar": _thumb_url(header.get("avatar")) or _thumb_url(channel_meta.get("avatar")),
+        "display_name": channel_meta.get("title") or header.get("title"),
+        "handle": (handle_runs[0].get("text") or "").lstrip("@") or None,
+        "subs": header.get("subscriberCountText", {}).get("simpleText"),
+    }
+    return {k: v for k, v in parsed.items() if v}
 
 def fetch_channel_metadata(url: str):
     """Scrape YouTube channel banner, avatar, display name, handle, subs, and top videos."""
-    if url in _channel_cache:
-        return _channel_cache[url]
+    cached = get_cached_channel_metadata(url)
+    if cached:
+        return cached
 
     meta = {"banner": None, "avatar": None, "display_name": None,
             "handle": None, "subs": None, "videos": []}
 
     try:
         # Basic metadata via HTML scrape
-        html = requests.get(url, timeout=10).text
-
-        m = re.search(r'https://yt3\.googleusercontent\.com/[A-Za-z0-9_\-]+[^\"]+', html)
-        if m: meta["banner"] = m.group(0)
-
-        m2 = re.search(r'"avatar":\{"thumbnails":\[{"url":"(https://yt3\.googleusercontent\.com/[^\"]+)"', html)
-        if m2: meta["avatar"] = m2.group(1)
-
-        m3 = re.search(r'"channelMetadataRenderer":\{"title":"([^"]+)"', html)
-        if m3:
-            meta["display_name"] = m3.group(1)
-        else:
-            m_fallback = re.search(r'"title":"([^"]+ - YouTube)"', html)
-            if m_fallback:
-                meta["display_name"] = m_fallback.group(1).replace(" - YouTube", "").strip()
-
-        m4 = re.search(r'"handle":"([^"]+)"', html)
-        if m4: meta["handle"] = m4.group(1)
-
-        m5 = re.search(r'"subscriberCountText":\{"simpleText":"([^"]+)"', html)
-        if m5: meta["subs"] = m5.group(1)
+        resp = SESSION.get(url, timeout=10)
+        resp.raise_for_status()
+        html = resp.text
+        meta.update(parse_initial_data(html))
+
+        # Regex fallbacks for anything the JSON header didn't provide
+        if not meta["banner"]:
+            m = re.search(r'https://yt3\.googleusercontent\.com/[A-Za-z0-9_\-]+[^\"]+', html)
+            if m: meta["banner"] = m.group(0)
+
+        if not meta["avatar"]:
+            m2 = re.search(r'"avatar":\{"thumbnails":\[{"url":"(https://yt3\.googleusercontent\.com/[^\"]+)"', html)
+            if m2: meta["avatar"] = m2.group(1)
+
+        if not meta["display_name"]:
+            m3 = re.search(r'"channelMetadataRenderer":\{"title":"([^"]+)"', html)
+            if m3:
+                meta["display_name"] = m3.group(1)
+            else:
+                m_fallback = re.search(r'"title":"([^"]+ - YouTube)"', html)
+                if m_fallback:
+                    meta["display_name"] = m_fallback.group(1).replace(" - YouTube", "").strip()
+
+        if not meta["handle"]:
+            m4 = re.search(r'"handle":"([^"]+)"', html)
+            if m4: meta["handle"] = m4.group(1)
+
+        if not meta["subs"]:
+            m5 = re.search(r'"subscriberCountText":\{"simpleText":"([^"]+)"', html)
+            if m5: meta["subs"] = m5.group(1)
 
         # ─ Fetch top 5 video titles using yt-dlp
-        cmd = [
-            "yt-dlp",
-            "--flat-playlist",
-            "--quiet",
-            "--no-warnings",
-            "--print", "%(title)s | %(webpage_url)s",
-            f"{url}/videos",
-        ]
         try:
-            output = subprocess.check_output(cmd, text=True, errors="ignore", timeout=10)
-            lines = [line.strip() for line in output.splitlines() if line.strip()]
+            entries = extract_entries(f"{url}/videos", playlistend=5)
             meta["videos"] = []
-            for line in lines[:5]:
-                parts = [p.strip() for p in line.split("|")]
-                if len(parts) == 2:
-                    title, video_url = parts
+            for entry in entries[:5]:
+                title, video_url = entry.get("title"), entry_url(entry)
+                if title and video_url:
                     meta["videos"].append({"title": title, "url": video_url})
-        except subprocess.TimeoutExpired:
-            print(f"⏰ Timeout getting videos for {url}")
-        except subprocess.CalledProcessError:
+        except DownloadError:
+            # Show what we have, but don't persist it — retry on the next view
             print(f"⚠️ yt-dlp failed fetching videos for {url}")
+            return meta
 
     except Exception as e:
+        # Don't persist a failed scrape — retry on the next view instead
         print(f"⚠️ Failed metadata fetch for {url}: {e}")
+        return meta
+
+    if not any(meta[k] for k in META_FIELDS):
+        # 200 but nothing parsed (consent/interstitial page) — don't persist that either
+        print(f"⚠️ No channel metadata found on page for {url}")
+        return meta
 
-    _channel_cache[url] = meta
+    save_channel_metadata(url, meta)
     return meta
 
 # ─────────────────────────────────────────────
 # Get next unverified artist
 # ─────────────────────────────────────────────
-def get_next_unverified():
-    ensure_verified_columns()
-    index_map = get_csv_index_map()
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT id, name, song_name, youtube_channel, verified
-        FROM artists
-        WHERE youtube_channel IS NOT NULL
-        AND TRIM(youtube_channel) <> ''
-        AND song_name IS NOT NULL
-        AND TRIM(song_name) <> ''
-        AND (verified IS NULL OR verified = 0)
-        ORDER BY name ASC
-    """)
-    rows = cur.fetchall()
-    conn.close()
-
-    sorted_rows = []
-    for (id_, name, song, channel, verified) in rows:
-        csv_index = index_map.get(channel, 999999)
-        if verified == 0 or verified is None:
-            sorted_rows.append((csv_index, id_, name, song, channel, verified))
-
-    if not sorted_rows:
+PREFETCH_AHEAD = 3  # upcoming channels whose metadata is scraped in the background
+PREFETCH = ThreadPoolExecutor(max_workers=PREFETCH_AHEAD)
+_pending_meta = {}  # channel url -> Future from PREFETCH
+_pending_meta_lock = Lock()
+
+UNVERIFIED_SQL = """
+    SELECT COALESCE(c.idx, 999999) AS csv_index,
+           a.id, a.name, a.song_name, a.youtube_channel, a.verified
+    FROM artists a
+    LEFT JOIN csv_order c ON c.url = a.youtube_channel
+    WHERE a.youtube_channel IS NOT NULL
+    AND TRIM(a.youtube_channel) <> ''
+    AND a.song_name IS NOT NULL
+    AND TRIM(a.song_name) <> ''
+    AND (a.verified IS NULL OR a.verified = 0)
+    ORDER BY csv_index ASC, a.name ASC
+    LIMIT ?
+"""
+
+def artist_with_metadata(rows):
+    """
+    Turn the first UNVERIFIED_SQL row into the card payload, and start
+    scraping metadata for the following rows so the next clicks are instant.
+    """
+    if not rows:
         return None
-
-    sorted_rows.sort(key=lambda x: x[0])
-    csv_index, id_, name, song, channel, verified = sorted_rows[0]
-    meta = fetch_channel_metadata(channel)
+    (csv_index, id_, name, song, channel, verified), *upcoming = rows
+
+    upcoming_urls = {row[4] for row in upcoming}
+    with _pending_meta_lock:
+        future = _pending_meta.pop(channel, None)
+        # Forget prefetches that are no longer coming up (reordered / verified elsewhere)
+        for url in [url for url in _pending_meta if url not in upcoming_urls]:
+            _pending_meta.pop(url).cancel()
+        for url in upcoming_urls:
+            if url not in _pending_meta:
+                _pending_meta[url] = PREFETCH.submit(fetch_channel_metadata, url)
+
+    meta = future.result() if future else fetch_channel_metadata(channel)
     return {"csv_index": csv_index, "id": id_, "name": name, "song": song,
             "channel": channel, "verified": verified, **meta}
 
+def get_next_unverified():
+    refresh_csv_order()
+    with WRITER_LOCK:
+        rows = WRITER.execute(UNVERIFIED_SQL, (1 + PREFETCH_AHEAD,)).fetchall()
+    return artist_with_metadata(rows)
+
 # ─────────────────────────────────────────────
 # API: verify one and load next
 # ─────────────────────────────────────────────
@@ -158,13 +288,19 @@ def verify():
     if status == 0:
         status = -1
 
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("UPDATE artists SET verified = ? WHERE id = ?", (status, artist_id))
-    conn.commit()
-    conn.close()
-
-    next_artist = get_next_unverified()
+    refresh_csv_order()
+    with WRITER_LOCK:
+        WRITER.execute("BEGIN IMMEDIATE")
+        try:
+            WRITER.execute("UPDATE artists SET verified = ? WHERE id = ?", (status, artist_id))
+            rows = WRITER.execute(UNVERIFIED_SQL, (1 + PREFETCH_AHEAD,)).fetchall()
+            WRITER.commit()
+        except Exception:
+            WRITER.rollback()
+            raise
+
+    # Metadata scraping is the slow part, so it happens outside the transaction
+    next_artist = artist_with_metadata(rows)
     return jsonify(success=True, next=next_artist)
 
 # ─────────────────────────────────────────────
@@ -1,102 +1,181 @@
 import re
 import json
-import subprocess
+import time
+import zlib
+import sqlite3
 import logging
 import unicodedata
-from typing import Optional, Tuple
-from difflib import SequenceMatcher
-import sqlite3
-
-DB_PATH = "artists.db"  # Path to your local SQLite file
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, local
+from weakref import WeakValueDictionary
+from typing import Iterable, Optional, Tuple
+from urllib.parse import quote_plus
+from functools import lru_cache
+from db import connect_db, ensure_indexes
+from fuzzy import best_match, ratio
+from ytdl import SEARCH_LIMIT, DownloadError, entry_url, extract_entries
+
+_thread_conns = local()
+
+def _get_conn():
+    """Return this thread's long-lived DB connection (WAL + tuned PRAGMAs), opening it on first use."""
+    conn = getattr(_thread_conns, "conn", None)
+    if conn is None:
+        conn = _thread_conns.conn = connect_db()
+        ensure_indexes(conn)
+        ensure_album_cache_table(conn)
+    return conn
+
+class LRUDict(OrderedDict):
+    """Dict capped at maxsize items, evicting the least recently read/written key."""
+
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+# In-process LRU in front of SQLite for known artist → channel links
+_CH_CAP = 4096
+_CH_TTL = 15 * 60  # seconds before a cached link is re-read, in case the DB row changed
+_CH_CACHE: LRUDict = LRUDict(_CH_CAP)  # artist → (url, time cached)
+_CH_LOCK = Lock()
+
+def _remember_channel(artist: str, url: str):
+    with _CH_LOCK:
+        _CH_CACHE[artist] = (url, time.monotonic())
+
+def get_artist_channel(artist: str, conn=None):
+    """Return cached YouTube channel if it exists (conn defaults to this thread's)."""
+    with _CH_LOCK:
+        url, cached_at = _CH_CACHE.get(artist, (None, 0.0))
+        if url and time.monotonic() - cached_at > _CH_TTL:
+            del _CH_CACHE[artist]
+            url = None
+    if url:
+        return url
+
+    conn = conn or _get_conn()
+    row = conn.execute("SELECT youtube_channel FROM artists WHERE name = ?", (artist,)).fetchone()
+    url = row[0] if row and row[0] else None
+    if url:
+        # Misses aren't cached: another process may still fill the channel in
+        _remember_channel(artist, url)
+    return url
+
+def set_artist_channel(artist: str, url: str, conn=None):
+    """Save or update YouTube channel link for artist (conn defaults to this thread's)."""
+    with conn or _get_conn() as conn:
+        conn.execute("UPDATE artists SET youtube_channel = ? WHERE name = ?", (url, artist))
+    _remember_channel(artist, url)
+
+def set_artist_channels(pairs: Iterable[Tuple[str, str]], conn=None):
+    """Save many (artist, url) channel links in a single transaction (conn defaults to this thread's)."""
+    rows = [(url, artist) for artist, url in pairs]
+    if not rows:
+        return
+    conn = conn or _get_conn()
+    conn.execute("BEGIN")
+    try:
+        conn.executemany("UPDATE artists SET youtube_channel = ? WHERE name = ?", rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    for url, artist in rows:
+        _remember_channel(artist, url)
 
-def get_artist_channel(artist: str):
-    """Return cached YouTube channel if it exists."""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT youtube_channel FROM artists WHERE name = ?", (artist,))
-    row = cur.fetchone()
-    conn.close()
-    return row[0] if row and row[0] else None
 
-def set_artist_channel(artist: str, url: str):
-    """Save or update YouTube channel link for artist."""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("UPDATE artists SET youtube_channel = ? WHERE name = ?", (url, artist))
-    conn.commit()
-    conn.close()
+LOGGER = logging.getLogger(__name__)
 
+# Scores at which the candidate loops stop early: an exact name match with a
+# @handle and "official" (1.0 + 0.3 + 0.15 + 0.1), and the highest score a
+# channel song search can produce (1.0 + 0.25 + 0.1)
+PERFECT_CHANNEL_SCORE = 1.55
+PERFECT_SONG_SCORE = 1.35
 
-LOGGER = logging.getLogger(__name__)
+# Options for the full-site artist search (other searches use the ytdl defaults).
+# No ignoreerrors: a failed search must raise, so it isn't mistaken for "no match".
+ARTIST_SEARCH_OPTS = {
+    "extractor_args": {"youtube": {"player_client": ["web"]}},
+}
 
 # ─────────────────────────────────────────────
 # TEXT NORMALIZATION
 # ─────────────────────────────────────────────
 
+_STOPWORDS_RE = re.compile(r"(?i)\b(vevo|topic|official|music|channel)\b")
+_NONALNUM_RE = re.compile(r"[^a-z0-9]")
+
+@lru_cache(maxsize=8192)
 def normalize_name(s: str) -> str:
     """Normalize artist/channel names for loose comparison."""
     s = unicodedata.normalize("NFKC", s.lower())
-    s = re.sub(r"(?i)\b(vevo|topic|official|music|channel)\b", "", s)
-    s = re.sub(r"[^a-z0-9]", "", s)
+    s = _STOPWORDS_RE.sub("", s)
+    s = _NONALNUM_RE.sub("", s)
     return s.strip()
 
 # ─────────────────────────────────────────────
 # CHANNEL CACHE (DB-INTEGRATED)
 # ─────────────────────────────────────────────
 
-def find_or_cache_artist_channel(artist: str) -> str:
+def find_or_cache_artist_channel(artist: str, save: bool = True) -> Optional[str]:
     """
     Find and cache the artist's actual YouTube channel handle.
     - Compares against display names (e.g. 'PLAT.') for matching
     - Caches the canonical handle (e.g. 'https://www.youtube.com/@plat.mp3')
     - Rejects weak matches
+    - save=False skips the DB write, for callers that batch it (see set_artist_channels)
+    - Returns "" when nothing matched, None when the search itself failed
     """
-    cached = get_artist_channel(artist)
+    conn = _get_conn()
+    cached = get_artist_channel(artist, conn)
     if cached:
         return cached
 
     artist_norm = normalize_name(artist)
     best_url, best_similarity = "", 0.0
 
-    cmd = [
-        "yt-dlp",
-        f"ytsearch20:{artist} official channel",
-        "--dump-json",
-        "--quiet",
-        "--ignore-errors",
-        "--no-warnings",
-        "--format", "bestaudio/best",
-        "--extractor-args", "youtube:player_client=web",
-    ]
-
     try:
-        output = subprocess.check_output(cmd, text=True, errors="ignore", stderr=subprocess.DEVNULL)
-    except subprocess.CalledProcessError:
+        entries = extract_entries(f"ytsearch20:{artist} official channel", **ARTIST_SEARCH_OPTS)
+    except DownloadError:
         LOGGER.warning("Failed to search YouTube for %s", artist)
-        return ""
-
-    for line in output.splitlines():
-        try:
-            data = json.loads(line)
-        except json.JSONDecodeError:
-            continue
+        return None
 
+    for data in entries:
         display_name = data.get("channel") or data.get("uploader") or data.get("title") or ""
         channel_url = (
             data.get("channel_url")
             or data.get("uploader_url")
-            or data.get("url")
             or ""
         )
         if not display_name or not channel_url or "youtube.com" not in channel_url:
             continue
 
         display_norm = normalize_name(display_name)
-        similarity = SequenceMatcher(None, artist_norm, display_norm).ratio()
 
-        # Skip mismatched lengths or very low similarity
+        # Cheap rejections first: mismatched lengths, or no shared first char/substring
         if abs(len(artist_norm) - len(display_norm)) > 3:
             continue
+        if (artist_norm and display_norm and artist_norm[0] != display_norm[0]
+                and artist_norm not in display_norm and display_norm not in artist_norm):
+            continue
+
+        similarity = ratio(artist_norm, display_norm, score_cutoff=0.6)
         if similarity < 0.6:
             continue
 
@@ -119,13 +198,16 @@ def find_or_cache_artist_channel(artist: str) -> str:
         if similarity > best_similarity:
             best_similarity = similarity
             best_url = channel_url
+            if best_similarity >= PERFECT_CHANNEL_SCORE:
+                break
 
     # Normalize to full URL
     if best_url and not best_url.startswith("https://"):
         best_url = f"https://www.youtube.com{best_url}"
 
     if best_url:
-        set_artist_channel(artist, best_url)
+        if save:
+            set_artist_channel(artist, best_url, conn)
         LOGGER.info("✅ Cached artist '%s' → %s (%.2f)", artist, best_url, best_similarity)
         return best_url
 
@@ -136,16 +218,115 @@ def find_or_cache_artist_channel(artist: str) -> str:
 # YOUTUBE ALBUM CACHE
 # ─────────────────────────────────────────────
 
-YOUTUBE_CACHE: dict[str, list[dict[str, str]]] = {}
+YOUTUBE_CACHE_SIZE = 512  # artists kept in memory
+YOUTUBE_CACHE: LRUDict = LRUDict(YOUTUBE_CACHE_SIZE)  # artist → CachedResults
+YOUTUBE_CACHE_LOCK = Lock()  # guards YOUTUBE_CACHE for search_youtube_for_songs workers
+_ALBUM_FILL_LOCKS: "WeakValueDictionary[str, Lock]" = WeakValueDictionary()  # one per artist being filled
+SONG_SEARCH_WORKERS = 8
+
+IGNORE_PHRASES = ("live", "visualiser", "shorts", "behind", "acoustic", "performance")
+PREFER_PHRASES = ("lyric", "official audio", "audio")
+
+# Substring checks as single alternations, so each title is scanned once
+_IGNORE_RE = re.compile("|".join(map(re.escape, IGNORE_PHRASES)))
+_PREFER_RE = re.compile("|".join(map(re.escape, PREFER_PHRASES)))
+_SONG_BOOST_RE = re.compile(r"lyric|audio|official")
+_SONG_PENALTY_RE = re.compile(r"live|remix|cover")
+
+def make_cache_entry(title: str, uploader: str, url: str) -> dict:
+    """Cache entry with the per-title work for find_best_from_cache done up front."""
+    title_lower = title.lower()
+    return {
+        "title": title,
+        "uploader": uploader,
+        "url": url,
+        "title_lower": title_lower,
+        "ignore": bool(_IGNORE_RE.search(title_lower)),
+        "prefer": bool(_PREFER_RE.search(title_lower)),
+    }
+
+ALBUM_CACHE_TTL = 7 * 86400  # seconds before a persisted album search is refetched
+
+def ensure_album_cache_table(conn):
+    """Create the on-disk copy of YOUTUBE_CACHE so album searches survive restarts."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS youtube_album_cache (
+            artist  TEXT NOT NULL,
+            album   TEXT NOT NULL,
+            payload BLOB NOT NULL,
+            ts      INTEGER NOT NULL,
+            PRIMARY KEY (artist, album)
+        )
+    """)
+
+def load_album_cache(artist_key: str, album: str) -> Optional[list]:
+    """Return persisted cache entries for (artist, album) if still fresh, else None."""
+    row = _get_conn().execute(
+        "SELECT payload FROM youtube_album_cache WHERE artist = ? AND album = ? AND ts > ?",
+        (artist_key, album, int(time.time()) - ALBUM_CACHE_TTL),
+    ).fetchone()
+    if not row:
+        return None
+    try:
+        return json.loads(zlib.decompress(row[0]))
+    except (zlib.error, ValueError):
+        return None
+
+def save_album_cache(artist_key: str, album: str, entries: list):
+    """Persist cache entries for (artist, album) as zlib-compressed JSON."""
+    payload = sqlite3.Binary(zlib.compress(json.dumps(entries).encode()))
+    _get_conn().execute(
+        "INSERT OR REPLACE INTO youtube_album_cache (artist, album, payload, ts) VALUES (?, ?, ?, ?)",
+        (artist_key, album, payload, int(time.time())),
+    )
+
+@dataclass
+class CachedResults:
+    """
+    An artist's cached search results, with the columns find_best_from_cache
+    scores kept as parallel lists (ignored titles already dropped).
+    """
+    entries: list[dict]
+    title_lower: list[str] = field(init=False)
+    urls: list[str] = field(init=False)
+    bonuses: list[float] = field(init=False)
+
+    def __post_init__(self):
+        kept = [entry for entry in self.entries if not entry["ignore"]]
+        self.title_lower = [entry["title_lower"] for entry in kept]
+        self.urls = [entry["url"] for entry in kept]
+        self.bonuses = [0.2 if entry["prefer"] else 0.0 for entry in kept]
+
+def _album_fill_lock(artist_key: str) -> Lock:
+    """Lock serializing cache fills for one artist (dropped once nobody holds it)."""
+    with YOUTUBE_CACHE_LOCK:
+        lock = _ALBUM_FILL_LOCKS.get(artist_key)
+        if lock is None:
+            lock = _ALBUM_FILL_LOCKS[artist_key] = Lock()
+        return lock
 
 def cache_youtube_album_search(artist: str, album: str):
     """
     Try to cache results from the artist's channel.
     If no valid channel found, fallback to a global search.
+    No-op if the artist is already cached; concurrent callers for the same
+    artist wait for the first one's fill instead of searching again.
     """
     artist_key = artist.lower()
-    if artist_key in YOUTUBE_CACHE:
-        LOGGER.info("✅ Using cached YouTube results for %s", artist)
+    with _album_fill_lock(artist_key):
+        with YOUTUBE_CACHE_LOCK:
+            cached = artist_key in YOUTUBE_CACHE
+        if cached:
+            LOGGER.debug("✅ Using cached YouTube results for %s", artist)
+            return
+        _fill_album_cache(artist, artist_key, album)
+
+def _fill_album_cache(artist: str, artist_key: str, album: str):
+    stored = load_album_cache(artist_key, album)
+    if stored is not None:
+        with YOUTUBE_CACHE_LOCK:
+            YOUTUBE_CACHE[artist_key] = CachedResults(stored)
+        LOGGER.info("✅ Loaded %d stored YouTube results for %s - %s", len(stored), artist, album)
         return
 
     # Get or find artist channel
@@ -155,37 +336,29 @@ def cache_youtube_album_search(artist: str, album: str):
 
     # Fallback to global search if still missing
     if channel_url:
-        search_url = f"{channel_url}/search?query={album.replace(' ', '+')}"
+        search_url = f"{channel_url}/search?query={quote_plus(album)}"
     else:
         LOGGER.warning("🌐 Falling back to global YouTube search for %s - %s", artist, album)
-        query = f"{artist} {album}".replace(" ", "+")
-        search_url = f"https://www.youtube.com/results?search_query={query}"
-
-    cmd = [
-        "yt-dlp",
-        "--flat-playlist", "--quiet", "--no-warnings",
-        "--print", "%(title)s|%(uploader)s|%(webpage_url)s",
-        search_url,
-    ]
+        search_url = f"https://www.youtube.com/results?search_query={quote_plus(f'{artist} {album}')}"
 
     try:
-        output = subprocess.check_output(cmd, text=True, errors="ignore", timeout=12)
-    except subprocess.TimeoutExpired:
-        LOGGER.warning("⏰ Timeout fetching search results for %s - %s", artist, album)
-        return
-    except subprocess.CalledProcessError:
+        results = extract_entries(search_url)
+    except DownloadError:
         LOGGER.warning("⚠️ Failed to fetch search results for %s - %s", artist, album)
         return
 
     entries = []
-    for line in output.splitlines():
-        parts = line.split("|")
-        if len(parts) < 3:
+    for result in results:
+        title, url = (result.get("title") or "").strip(), entry_url(result)
+        if not title or not url:
             continue
-        title, uploader, url = [p.strip() for p in parts[:3]]
-        entries.append({"title": title, "uploader": uploader, "url": url})
+        entries.append(make_cache_entry(title, result.get("uploader") or "", url))
 
-    YOUTUBE_CACHE[artist_key] = entries
+    with YOUTUBE_CACHE_LOCK:
+        YOUTUBE_CACHE[artist_key] = CachedResults(entries)
+    if entries:
+        # Empty results aren't persisted, so one bad search doesn't stick for ALBUM_CACHE_TTL
+        save_album_cache(artist_key, album, entries)
     LOGGER.info("💾 Cached %d YouTube results for %s - %s", len(entries), artist, album)
 
 # ─────────────────────────────────────────────
@@ -195,27 +368,15 @@ def cache_youtube_album_search(artist: str, album: str):
 def find_best_from_cache(artist: str, song: str) -> Optional[str]:
     """Return best cached match for a song."""
     artist_key = artist.lower()
-    if artist_key not in YOUTUBE_CACHE:
+    with YOUTUBE_CACHE_LOCK:
+        cached = YOUTUBE_CACHE.get(artist_key)
+    if cached is None:
         LOGGER.warning("⚠️ No cached results for %s yet. Run cache_youtube_album_search() first.", artist)
         return None
 
-    ignore_phrases = ("live", "visualiser", "shorts", "behind", "acoustic", "performance")
-    prefer_phrases = ("lyric", "official audio", "audio")
-
-    candidates = YOUTUBE_CACHE[artist_key]
-    best_url, best_score = None, -1.0
-
-    for entry in candidates:
-        title = entry["title"].lower()
-        if any(p in title for p in ignore_phrases):
-            continue
-
-        score = SequenceMatcher(None, song.lower(), title).ratio()
-        if any(p in title for p in prefer_phrases):
-            score += 0.2
-        if score > best_score:
-            best_score = score
-            best_url = entry["url"]
+    # Score every kept title (+ prefer bonus) against the song in one batched call
+    best, best_score = best_match(song.lower(), cached.title_lower, cached.bonuses)
+    best_url = cached.urls[best] if best >= 0 else None
 
     if best_url:
         LOGGER.info("🎵 Matched '%s' → %s (score=%.2f)", song, best_url, best_score)
@@ -246,46 +407,39 @@ def search_youtube_for_song(
     # 1️⃣ Direct channel search (preferred)
     # ─────────────────────────────────────────────
     if channel_url:
-        query_url = f"{channel_url}/search?query={name.replace(' ', '+')}"
-        cmd = [
-            "yt-dlp",
-            "--flat-playlist",
-            "--quiet",
-            "--no-warnings",
-            "--print", "%(title)s | %(uploader)s | %(webpage_url)s",
-            query_url,
-        ]
+        query_url = f"{channel_url}/search?query={quote_plus(name)}"
         try:
-            output = subprocess.check_output(cmd, text=True, errors="ignore", timeout=12)
-        except subprocess.TimeoutExpired:
-            LOGGER.warning("⏰ Timeout searching channel %s for %s", channel_url, name)
-            output = ""
-        except subprocess.CalledProcessError:
+            results = extract_entries(query_url, playlistend=SEARCH_LIMIT)
+        except DownloadError:
             LOGGER.warning("⚠️ yt-dlp failed for %s", channel_url)
-            output = ""
+            results = []
 
         best_url, best_score = None, 0.0
         song_norm = normalize_name(name)
 
-        for line in output.splitlines():
-            parts = [p.strip() for p in line.split("|")]
-            if len(parts) < 3:
+        for result in results:
+            title, url = (result.get("title") or "").strip(), entry_url(result)
+            if not title or not url:
                 continue
-            title, uploader, url = parts[:3]
             title_norm = normalize_name(title)
-            score = SequenceMatcher(None, song_norm, title_norm).ratio()
 
             # Boosts
+            bonus = 0.0
             if song_norm in title_norm or title_norm in song_norm:
-                score += 0.25
-            if any(k in title_norm for k in ["lyric", "audio", "official"]):
-                score += 0.1
-            if any(k in title_norm for k in ["live", "remix", "cover"]):
-                score -= 0.05
+                bonus += 0.25
+            if _SONG_BOOST_RE.search(title_norm):
+                bonus += 0.1
+            if _SONG_PENALTY_RE.search(title_norm):
+                bonus -= 0.05
+
+            # A raw score below this can neither pass the 0.40 bar nor beat best_score
+            score = ratio(song_norm, title_norm, score_cutoff=max(0.40, best_score) - bonus) + bonus
 
             if score > best_score:
                 best_score = score
                 best_url = url
+                if best_score >= PERFECT_SONG_SCORE:
+                    break
 
         if best_url and best_score >= 0.40:
             LOGGER.info("🎵 Found match for %s on channel → %s (%.2f)", name, best_url, best_score)
@@ -296,9 +450,8 @@ def search_youtube_for_song(
     # ─────────────────────────────────────────────
     # 2️⃣ Fallback: cached album search (same as before)
     # ─────────────────────────────────────────────
-    if artist.lower() not in YOUTUBE_CACHE and album:
-        LOGGER.debug("📦 Caching album results for %s - %s", artist, album)
-        cache_youtube_album_search(artist, album)
+    if album:
+        cache_youtube_album_search(artist, album)  # no-op once the artist is cached
 
     cached_url = find_best_from_cache(artist, name)
     if cached_url:
@@ -308,23 +461,41 @@ def search_youtube_for_song(
     # 3️⃣ Global fallback ytsearch
     # ─────────────────────────────────────────────
     query = f"{artist} {name}"
-    cmd = ["yt-dlp", "--quiet", "--no-warnings", "--get-id", f"ytsearch5:{query}"]
 
     try:
-        output = subprocess.check_output(cmd, text=True, errors="ignore", timeout=10)
-        ids = [line.strip() for line in output.splitlines() if line.strip()]
+        ids = [r["id"] for r in extract_entries(f"ytsearch5:{query}") if r.get("id")]
         if ids:
             best_url = f"https://www.youtube.com/watch?v={ids[0]}"
             LOGGER.info("🎵 Global fallback match for %s - %s → %s", artist, name, best_url)
             return best_url, None
-    except subprocess.TimeoutExpired:
-        LOGGER.warning("⏰ Timeout for fallback search %s - %s", artist, name)
-    except subprocess.CalledProcessError:
+    except DownloadError:
         LOGGER.warning("❌ yt-dlp error during fallback search for %s - %s", artist, name)
 
     LOGGER.warning("❌ No YouTube match found for %s - %s", artist, name)
     return None, None
 
+# ─────────────────────────────────────────────
+# BATCH SONG SEARCH
+# ─────────────────────────────────────────────
+
+def search_youtube_for_songs(
+    items: list[tuple[str, str, Optional[str], Optional[str]]],
+) -> list[Tuple[Optional[str], Optional[str]]]:
+    """
+    Run search_youtube_for_song for many (name, artist, album, channel_url)
+    tuples concurrently. Results are returned in the same order as items.
+    """
+    with ThreadPoolExecutor(max_workers=SONG_SEARCH_WORKERS) as executor:
+        # Warm the album cache once per artist for songs without a channel, which
+        # always need it; a channel miss fills it on demand under _album_fill_lock
+        albums = {}
+        for name, artist, album, channel_url in items:
+            if album and not channel_url:
+                albums.setdefault(artist.lower(), (artist, album))
+        list(executor.map(lambda pair: cache_youtube_album_search(*pair), albums.values()))
+
+        return list(executor.map(lambda item: search_youtube_for_song(*item), items))
+
 
 # ─────────────────────────────────────────────
 # MANUAL TEST ENTRYPOINT
@@ -0,0 +1,41 @@
+import threading
+from yt_dlp import YoutubeDL
+from yt_dlp.utils import DownloadError
+
+__all__ = ["BASE_OPTS", "SEARCH_LIMIT", "DownloadError", "get_ydl", "extract_entries", "entry_url"]
+
+# ─────────────────────────────────────────────
+# IN-PROCESS YT-DLP
+# ─────────────────────────────────────────────
+BASE_OPTS = {
+    "quiet": True,
+    "no_warnings": True,
+    "skip_download": True,
+    "extract_flat": True,
+    "socket_timeout": 12,
+}
+
+# playlistend for searches that only need the top hits, so yt-dlp stops paging
+# channel /search listings; full listings (e.g. the album cache) don't pass it
+SEARCH_LIMIT = 50
+
+_local = threading.local()
+
+def get_ydl(**opts) -> YoutubeDL:
+    """Return this thread's YoutubeDL for the given option overrides, creating it on first use."""
+    instances = getattr(_local, "instances", None)
+    if instances is None:
+        instances = _local.instances = {}
+    key = repr(sorted(opts.items()))
+    if key not in instances:
+        instances[key] = YoutubeDL({**BASE_OPTS, **opts})
+    return instances[key]
+
+def extract_entries(url: str, **opts) -> list[dict]:
+    """Return the (flat) entries yt-dlp finds for a search/channel/playlist URL."""
+    info = get_ydl(**opts).extract_info(url, download=False) or {}
+    return [e for e in info.get("entries") or [] if e]
+
+def entry_url(entry: dict) -> str:
+    """Best-effort video URL for a flat entry (flat results may lack webpage_url)."""
+    return entry.get("webpage_url") or entry.get("url") or ""